@@ -1,8 +1,20 @@
 import os
 import json
+import asyncio
+import atexit
+import collections
 import logging
+import logging.handlers
+import mimetypes
+import queue
+import shutil
 import tempfile
+import threading
+import zipfile
+import httplib2
+import httpx
 from telegram import Update
+from telegram.request import HTTPXRequest
 from telegram.ext import (
     Application,
     CommandHandler,
@@ -10,15 +22,24 @@ from telegram.ext import (
     ContextTypes,
     filters
 )
+import google_auth_httplib2
+import google.auth.exceptions
 from google.oauth2 import service_account
 from googleapiclient.discovery import build
-from googleapiclient.http import MediaFileUpload
+from googleapiclient.http import MediaIoBaseUpload
 from googleapiclient.errors import HttpError
 
+try:
+    import uvloop  # Faster event loop; not available on Windows
+except ImportError:
+    uvloop = None
+
 # Validate environment variables
 TELEGRAM_TOKEN = os.environ.get('TELEGRAM_TOKEN')
 SERVICE_ACCOUNT_JSON = os.environ.get('GOOGLE_SERVICE_ACCOUNT_JSON')
 DRIVE_FOLDER_ID = os.environ.get('GOOGLE_DRIVE_FOLDER_ID')  # New environment variable
+# Opt-in: make the whole folder public so uploads inherit link access
+SHARE_FOLDER = os.environ.get('GOOGLE_DRIVE_SHARE_FOLDER', '').lower() in ('1', 'true', 'yes')
 
 if not TELEGRAM_TOKEN:
     raise RuntimeError("TELEGRAM_TOKEN environment variable not set!")
@@ -27,56 +48,164 @@ if not SERVICE_ACCOUNT_JSON:
 if not DRIVE_FOLDER_ID:
     raise RuntimeError("GOOGLE_DRIVE_FOLDER_ID environment variable not set!")
 
-# Set up logging
-logging.basicConfig(
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    level=logging.INFO
+# Set up logging: records are handed to a background thread through a queue
+# so uploads never wait on stdout, and only this module logs at INFO
+_log_queue = queue.SimpleQueue()
+_log_handler = logging.StreamHandler()
+_log_handler.setFormatter(
+    logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 )
+_log_listener = logging.handlers.QueueListener(_log_queue, _log_handler)
+_log_listener.start()
+atexit.register(_log_listener.stop)
+
+root_logger = logging.getLogger()
+root_logger.setLevel(logging.WARNING)
+root_logger.addHandler(logging.handlers.QueueHandler(_log_queue))
 logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+# Silence per-request chatter from the HTTP and API client libraries
+logging.getLogger('googleapiclient.discovery_cache').setLevel(logging.ERROR)
+for noisy_logger in ('googleapiclient.http', 'httplib2', 'httpx'):
+    logging.getLogger(noisy_logger).setLevel(logging.WARNING)
 
-# Parse service account credentials
+# Parse service account credentials (loaded once, shared by every thread)
 try:
     service_account_info = json.loads(SERVICE_ACCOUNT_JSON)
 except json.JSONDecodeError as e:
     logger.error("Failed to parse service account JSON: %s", e)
     raise
 
-# Google Drive service setup
+credentials = service_account.Credentials.from_service_account_info(
+    service_account_info,
+    scopes=['https://www.googleapis.com/auth/drive.file']
+)
+
+# Socket timeout (seconds) for Drive API requests and file downloads
+HTTP_TIMEOUT = 60
+
+# Google Drive service setup (built once per worker thread, since the
+# underlying httplib2 client is not thread-safe). Each thread keeps its own
+# keep-alive connection, so create + permission calls reuse one TLS session.
+_thread_local = threading.local()
+
 def get_drive_service():
-    credentials = service_account.Credentials.from_service_account_info(
-        service_account_info,
-        scopes=['https://www.googleapis.com/auth/drive.file']
-    )
-    return build('drive', 'v3', credentials=credentials)
+    service = getattr(_thread_local, 'drive_service', None)
+    if service is None:
+        authed_http = google_auth_httplib2.AuthorizedHttp(
+            credentials,
+            http=httplib2.Http(timeout=HTTP_TIMEOUT)
+        )
+        service = build(
+            'drive', 'v3',
+            http=authed_http,
+            static_discovery=True,  # Discovery doc bundled with the client library
+            cache_discovery=False
+        )
+        _thread_local.drive_service = service
+    return service
+
+# Files at or below this size go up in a single multipart request;
+# larger ones use the resumable protocol (session init + chunk PUTs)
+RESUMABLE_THRESHOLD = 5 * 1024 * 1024
+# Resumable uploads go up in a single PUT (-1): the whole file is already
+# buffered locally, so splitting it only adds requests
+RESUMABLE_CHUNK_SIZE = -1
+# Downloads are buffered in memory up to this size before spilling to disk;
+# the Bot API never serves files larger than 20 MB
+SPOOL_MAX_SIZE = 20 * 1024 * 1024
+# Larger downloads spill into tmpfs when it is available and has room,
+# falling back to the default (disk-backed) temp dir otherwise
+TMPFS_DIR = '/dev/shm' if os.access('/dev/shm', os.W_OK) else None
+TMPFS_MAX_SIZE = 256 * 1024 * 1024
+# Updates handled at once; album files and other users' messages overlap
+MAX_CONCURRENT_UPDATES = 32
+# Files transferred (downloaded and uploaded) at once across all chats; held
+# for the whole transfer so at most this many buffers sit in memory
+MAX_CONCURRENT_UPLOADS = 4
+# How long to wait for the rest of an album after its first file arrives
+MEDIA_GROUP_TIMEOUT = 1.5
+# Read size when streaming files down from Telegram
+DOWNLOAD_CHUNK_SIZE = 1024 * 1024
+
+# Created in post_init, on the loop the bot actually runs (uvloop or not):
+# the transfer slots and a shared client for Telegram file downloads, so
+# connections are pooled across files instead of set up per download
+_upload_semaphore = None
+_download_client = None
+
+# "Anyone with the link can view"
+PUBLIC_PERMISSION = {'type': 'anyone', 'role': 'reader'}
+
+# True once DRIVE_FOLDER_ID itself is shared publicly; uploaded files then
+# inherit link access and need no permission call of their own
+_folder_is_public = False
+
+# Share the upload folder once at startup (only with GOOGLE_DRIVE_SHARE_FOLDER set)
+def share_drive_folder():
+    global _folder_is_public
+    try:
+        get_drive_service().permissions().create(
+            fileId=DRIVE_FOLDER_ID,
+            body=PUBLIC_PERMISSION,
+            fields='id'
+        ).execute()
+        _folder_is_public = True
+        logger.info("Shared Drive folder publicly; files will inherit access")
+    except HttpError as error:
+        # e.g. the drive.file scope cannot touch a folder the bot didn't create
+        logger.warning(
+            f"Could not share Drive folder ({error.resp.status} - {error.reason}); "
+            f"falling back to per-file permissions"
+        )
+    except (google.auth.exceptions.GoogleAuthError, httplib2.HttpLib2Error, OSError) as error:
+        # Auth or network trouble at startup shouldn't keep the bot from polling
+        logger.warning(
+            f"Could not share Drive folder ({error}); "
+            f"falling back to per-file permissions"
+        )
 
 # Upload to Google Drive
-def upload_to_drive(file_path, file_name):
+def upload_to_drive(file_obj, file_name, size, mime_type=None):
     try:
         service = get_drive_service()
+        mime_type = (
+            mime_type
+            or mimetypes.guess_type(file_name)[0]
+            or 'application/octet-stream'
+        )
         
         file_metadata = {
             'name': file_name,
+            'mimeType': mime_type,
             'parents': [DRIVE_FOLDER_ID]  # Upload to specific folder
         }
-        media = MediaFileUpload(file_path, resumable=True)
+        media = MediaIoBaseUpload(
+            file_obj,
+            mimetype=mime_type,
+            resumable=size > RESUMABLE_THRESHOLD,
+            chunksize=RESUMABLE_CHUNK_SIZE
+        )
         
         # Upload file
         file = service.files().create(
             body=file_metadata,
             media_body=media,
-            fields='id'
+            fields='id,webViewLink'
         ).execute()
         file_id = file.get('id')
         logger.info(f"Uploaded '{file_name}' to Drive. ID: {file_id}")
         
-        # Set public permissions
-        permission = {'type': 'anyone', 'role': 'reader'}
-        service.permissions().create(
-            fileId=file_id,
-            body=permission
-        ).execute()
+        # Set public permissions (unless inherited from the shared folder)
+        if not _folder_is_public:
+            service.permissions().create(
+                fileId=file_id,
+                body=PUBLIC_PERMISSION,
+                fields='id'
+            ).execute()
         
-        return f"https://drive.google.com/file/d/{file_id}/view"
+        return file.get('webViewLink') or f"https://drive.google.com/file/d/{file_id}/view"
     
     except HttpError as error:
         logger.error(f"Google Drive API error: {error}")
@@ -85,6 +214,100 @@ def upload_to_drive(file_path, file_name):
         logger.error(f"Upload error: {e}")
         raise
 
+# Stream a Telegram file into out chunk by chunk, without holding the whole
+# response in memory first
+async def download_file(tg_file, out):
+    try:
+        async with _download_client.stream('GET', tg_file.file_path) as response:
+            response.raise_for_status()
+            async for chunk in response.aiter_bytes(DOWNLOAD_CHUNK_SIZE):
+                out.write(chunk)
+    # The file URL embeds the bot token, so keep it out of the error (and logs)
+    except httpx.HTTPStatusError as error:
+        raise Exception(f"Telegram download error: {error.response.status_code}") from None
+    except httpx.HTTPError as error:
+        raise Exception(f"Telegram download error: {type(error).__name__}") from None
+
+async def open_transfer_resources(application):
+    global _upload_semaphore, _download_client
+    _upload_semaphore = asyncio.Semaphore(MAX_CONCURRENT_UPLOADS)
+    _download_client = httpx.AsyncClient(
+        http2=True,
+        limits=httpx.Limits(max_connections=50, max_keepalive_connections=50),
+        timeout=httpx.Timeout(HTTP_TIMEOUT, connect=10)
+    )
+
+async def close_transfer_resources(application):
+    if _download_client is not None:
+        await _download_client.aclose()
+
+# Buffer for a download of roughly expected_size bytes
+def spooled_buffer(expected_size):
+    spool_dir = None
+    if TMPFS_DIR and expected_size <= TMPFS_MAX_SIZE:
+        # Leave room for every other transfer that may be spilling alongside
+        # this one; Docker's default /dev/shm is only 64 MB
+        try:
+            if shutil.disk_usage(TMPFS_DIR).free > expected_size * MAX_CONCURRENT_UPLOADS:
+                spool_dir = TMPFS_DIR
+        except OSError:
+            pass
+    return tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_SIZE, dir=spool_dir)
+
+# Upload a downloaded buffer to Drive and report the link back to the user
+async def upload_and_reply(message, buffer, file_name, size, details, mime_type=None):
+    try:
+        drive_link = await asyncio.to_thread(
+            upload_to_drive, buffer, file_name, size, mime_type
+        )
+        await message.reply_text(
+            f"✅ File uploaded to Google Drive!\n\n"
+            f"{details}\n"
+            f"🔗 Download link: {drive_link}"
+        )
+    except Exception as e:
+        logger.error(f"Upload failed: {e}", exc_info=True)
+        await message.reply_text(f"❌ Upload failed: {str(e)}")
+
+# Album files that are still being collected, keyed by media_group_id
+_media_groups = {}
+# Albums already archived; files that straggle in later are uploaded alone
+_flushed_media_groups = collections.deque(maxlen=100)
+
+# Bundle an album into a single ZIP so it costs one Drive upload, not one per file
+async def upload_media_group(message, members):
+    archive_name = f"album_{message.media_group_id}.zip"
+    total_size = sum(file_obj.file_size or 0 for file_obj, _ in members)
+    async with _upload_semaphore:
+        with spooled_buffer(total_size) as buffer:
+            try:
+                # Telegram media is already compressed, so store entries as-is
+                with zipfile.ZipFile(buffer, 'w', compression=zipfile.ZIP_STORED) as archive:
+                    used_names = set()
+                    for file_obj, name in members:
+                        # Documents can share a name; keep every entry distinct
+                        if name in used_names:
+                            stem, ext = os.path.splitext(name)
+                            name = f"{stem}_{file_obj.file_unique_id}{ext}"
+                        used_names.add(name)
+                        
+                        tg_file = await file_obj.get_file()
+                        with archive.open(name, 'w') as entry:
+                            await download_file(tg_file, entry)
+            except Exception as e:
+                logger.error(f"Archiving '{archive_name}' failed: {e}", exc_info=True)
+                await message.reply_text(f"❌ Album archive failed: {str(e)}")
+                return
+            size = buffer.tell()
+            buffer.seek(0)
+            logger.info(f"Archived {len(members)} files into '{archive_name}' ({size} bytes)")
+            
+            await upload_and_reply(
+                message, buffer, archive_name, size,
+                f"🗂 Archive: {archive_name} ({len(members)} files)",
+                'application/zip'
+            )
+
 # Telegram Handlers (unchanged)
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     await update.message.reply_text('📤 Send me a file to upload to Google Drive!')
@@ -92,61 +315,101 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
 async def handle_file(update: Update, context: ContextTypes.DEFAULT_TYPE):
     message = update.message
     
-    # Get file based on type
+    # Get file based on type (Telegram reports the MIME type for all but photos)
     if message.document:
         file_obj = message.document
-        tg_file = await file_obj.get_file()
-        original_name = file_obj.file_name
+        original_name = file_obj.file_name or f"document_{file_obj.file_unique_id}"
+        mime_type = file_obj.mime_type
     elif message.photo:
         file_obj = message.photo[-1]
-        tg_file = await file_obj.get_file()
         original_name = f"photo_{file_obj.file_id}.jpg"
+        mime_type = 'image/jpeg'
     elif message.video:
         file_obj = message.video
-        tg_file = await file_obj.get_file()
         original_name = file_obj.file_name or f"video_{file_obj.file_id}.mp4"
+        mime_type = file_obj.mime_type
     elif message.audio:
         file_obj = message.audio
-        tg_file = await file_obj.get_file()
         original_name = file_obj.file_name or f"audio_{file_obj.file_id}.mp3"
+        mime_type = file_obj.mime_type
     else:
         await message.reply_text("❌ Unsupported file type!")
         return
 
-    # Create temp file
-    suffix = os.path.splitext(original_name)[1] if '.' in original_name else ''
-    with tempfile.NamedTemporaryFile(delete=False, suffix=suffix) as temp_file:
-        download_path = temp_file.name
-    
-    # Download file
-    await tg_file.download_to_drive(download_path)
-    logger.info(f"Downloaded file to temp path: {download_path}")
-    
-    # Upload to Drive
-    try:
-        drive_link = upload_to_drive(download_path, original_name)
-        await message.reply_text(
-            f"✅ File uploaded to Google Drive!\n\n"
-            f"📄 Filename: {original_name}\n"
-            f"🔗 Download link: {drive_link}"
+    # Album: the first file collects the rest of the group, later ones just join it
+    if message.media_group_id in _flushed_media_groups:
+        logger.warning(
+            f"'{original_name}' arrived after album {message.media_group_id} "
+            f"was archived; uploading it separately"
         )
-    except Exception as e:
-        logger.error(f"Upload failed: {e}", exc_info=True)
-        await message.reply_text(f"❌ Upload failed: {str(e)}")
-    finally:
-        # Clean up temp file
-        if os.path.exists(download_path):
-            os.remove(download_path)
+    elif message.media_group_id:
+        group = _media_groups.get(message.media_group_id)
+        if group is not None:
+            group.append((file_obj, original_name))
+            return
+        group = _media_groups[message.media_group_id] = [(file_obj, original_name)]
+        await asyncio.sleep(MEDIA_GROUP_TIMEOUT)
+        del _media_groups[message.media_group_id]
+        _flushed_media_groups.append(message.media_group_id)
+        await upload_media_group(message, group)
+        return
+
+    # Download into a memory-backed buffer (no temp file on disk), holding a
+    # transfer slot until the upload finishes
+    async with _upload_semaphore:
+        with spooled_buffer(file_obj.file_size or 0) as buffer:
+            try:
+                tg_file = await file_obj.get_file()
+                await download_file(tg_file, buffer)
+            except Exception as e:
+                logger.error(f"Download failed: {e}", exc_info=True)
+                await message.reply_text(f"❌ Download failed: {str(e)}")
+                return
+            size = buffer.tell()
+            buffer.seek(0)
+            logger.info(f"Downloaded '{original_name}' ({size} bytes)")
+            
+            # Upload to Drive
+            await upload_and_reply(
+                message, buffer, original_name, size,
+                f"📄 Filename: {original_name}",
+                mime_type
+            )
 
 def main():
-    application = Application.builder().token(TELEGRAM_TOKEN).build()
+    if SHARE_FOLDER:
+        share_drive_folder()
+    
+    if uvloop is not None:
+        asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
+    
+    application = (
+        Application.builder()
+        .token(TELEGRAM_TOKEN)
+        .request(HTTPXRequest(
+            connection_pool_size=50,
+            http_version='2',
+            read_timeout=HTTP_TIMEOUT
+        ))
+        .concurrent_updates(MAX_CONCURRENT_UPDATES)
+        .post_init(open_transfer_resources)
+        .post_shutdown(close_transfer_resources)
+        .build()
+    )
     application.add_handler(CommandHandler("start", start))
     application.add_handler(MessageHandler(
         filters.Document.ALL | filters.PHOTO | filters.VIDEO | filters.AUDIO,
         handle_file
     ))
     logger.info("Bot is running on Render.com...")
-    application.run_polling()
+    # Long-poll so new updates are picked up as soon as they arrive; only
+    # messages are needed, and stale ones from before a restart are dropped
+    application.run_polling(
+        poll_interval=0,
+        timeout=30,
+        allowed_updates=[Update.MESSAGE],
+        drop_pending_updates=True
+    )
 
 if __name__ == '__main__':
     main()